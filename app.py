@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash, g, has_request_context
 import firebase_admin
 from firebase_admin import credentials, db, auth as firebase_auth
 import plotly.graph_objects as go
@@ -18,6 +18,12 @@ import atexit
 import pyrebase
 from firebase_config import firebaseConfig
 import base64
+import re
+from array import array
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -32,16 +38,47 @@ auth = firebase.auth()
 # Zona horaria local (UTC-5)
 LOCAL_TZ = pytz.timezone('America/Bogota')
 
+# Conversión de luz a foot-candles
+DEFAULT_FOOT_CANDLES = float(os.environ.get('DEFAULT_FOOT_CANDLES', 12))
+THRESHOLD_FOOT_CANDLES = float(os.environ.get('THRESHOLD_FOOT_CANDLES', 7))
+
+# 'server': figuras completas en el HTML; 'client': plantilla estática y datos desde /api/sensor/<sensor_id>
+PLOT_RENDER_MODE = os.environ.get('PLOT_RENDER_MODE', 'server').lower()
+
+# "Ver todo" con memoria acotada: un mes de RTDB a la vez y arrays compactos en lugar de tuplas
+VIEW_ALL_BOUNDED_MEMORY = os.environ.get('VIEW_ALL_BOUNDED_MEMORY', 'true').lower() == 'true'
+VIEW_ALL_MEMORY_BUDGET_MB = float(os.environ.get('VIEW_ALL_MEMORY_BUDGET_MB', 32))
+BYTES_PER_READING = 24  # timestamp int64 + temperatura float64 + luz float64
+# Pico medido por punto al serializar (strings ISO, listas JSON, go.Figure, HTML): el presupuesto
+# limita los puntos que llegan a la salida, no solo los arrays compactos
+OUTPUT_BYTES_PER_POINT = 640
+
 # Verificar que el archivo de credenciales existe
 cred_path = 'ensayos-rack-firebase-adminsdk-jkauk-cfa68835d5.json'
 if not os.path.exists(cred_path):
     raise FileNotFoundError(f"Archivo de credenciales no encontrado: {cred_path}")
 
+# Tolerancia a fallos de RTDB (timeouts y circuit breaker)
+RTDB_TIMEOUT_SECONDS = float(os.environ.get('RTDB_TIMEOUT_SECONDS', 5))
+RTDB_BREAKER_THRESHOLD = int(os.environ.get('RTDB_BREAKER_THRESHOLD', 3))
+RTDB_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('RTDB_BREAKER_COOLDOWN_SECONDS', 30))
+RTDB_MAX_WORKERS = int(os.environ.get('RTDB_MAX_WORKERS', 8))
+# Límites del respaldo de últimos resultados buenos (LRU por número de entradas y antigüedad).
+# Cada sensor usa hasta 5 claves: la lista superficial de meses, los 2 meses de la vista por
+# defecto (último mes), un tercer mes para rangos que lo crucen y la serie compacta de "ver todo";
+# el índice usa 1 más. Con menos entradas el LRU expulsa datos de la vista normal y, durante una
+# caída, las páginas quedan sin respaldo. Los meses de "ver todo" con fechas no se guardan.
+RTDB_CACHE_SENSORS = int(os.environ.get('RTDB_CACHE_SENSORS', 4))
+RTDB_CACHE_MAX_ENTRIES = int(os.environ.get('RTDB_CACHE_MAX_ENTRIES', 1 + 5 * RTDB_CACHE_SENSORS))
+RTDB_CACHE_MAX_AGE_SECONDS = float(os.environ.get('RTDB_CACHE_MAX_AGE_SECONDS', 6 * 3600))
+
 # Inicializar Firebase con RTDB
 try:
     cred = credentials.Certificate(cred_path)
     firebase_admin.initialize_app(cred, {
-        'databaseURL': 'https://ensayos-rack-default-rtdb.firebaseio.com'
+        'databaseURL': 'https://ensayos-rack-default-rtdb.firebaseio.com',
+        # Límite duro para las peticiones HTTP del SDK (el timeout por llamada es menor)
+        'httpTimeout': RTDB_TIMEOUT_SECONDS * 4
     })
 except Exception as e:
     print(f"Error al inicializar Firebase: {e}")
@@ -50,6 +87,123 @@ except Exception as e:
 # Cache para estado del LED
 cached_led_state = None
 
+# Lecturas a RTDB: pool con timeout, último resultado bueno por path y estado del breaker
+rtdb_executor = ThreadPoolExecutor(max_workers=RTDB_MAX_WORKERS, thread_name_prefix='rtdb')
+rtdb_cache = OrderedDict()  # clave (path de RTDB o resultado compacto) -> (momento de la lectura, datos), orden LRU
+rtdb_lock = threading.Lock()
+rtdb_breaker = {'failures': 0, 'opened_at': None, 'probing': False}
+
+class RTDBUnavailable(Exception):
+    """RTDB no respondió y no hay datos previos en cache para la clave"""
+
+def _breaker_allows_call():
+    """
+    Indica si se puede consultar RTDB según el estado del circuit breaker.
+    Devuelve (permitida, es_prueba); es_prueba marca la única llamada del estado semiabierto.
+    """
+    with rtdb_lock:
+        if rtdb_breaker['opened_at'] is None:
+            return True, False
+        if rtdb_breaker['probing']:
+            return False, False
+        if time.monotonic() - rtdb_breaker['opened_at'] >= RTDB_BREAKER_COOLDOWN_SECONDS:
+            # Semiabierto: dejar pasar una sola llamada de prueba
+            rtdb_breaker['probing'] = True
+            return True, True
+        return False, False
+
+def _record_rtdb_success():
+    with rtdb_lock:
+        if rtdb_breaker['opened_at'] is not None:
+            logging.info("RTDB responde de nuevo, cerrando circuit breaker.")
+        rtdb_breaker.update(failures=0, opened_at=None, probing=False)
+
+def _record_rtdb_failure(is_probe):
+    with rtdb_lock:
+        rtdb_breaker['failures'] += 1
+        if is_probe or rtdb_breaker['failures'] >= RTDB_BREAKER_THRESHOLD:
+            if rtdb_breaker['opened_at'] is None:
+                logging.warning(f"Abriendo circuit breaker de RTDB tras {rtdb_breaker['failures']} fallos.")
+            rtdb_breaker['opened_at'] = time.monotonic()
+        # Solo la propia prueba libera el estado semiabierto; fallos tardíos de llamadas
+        # anteriores no deben dejar pasar una segunda prueba
+        if is_probe:
+            rtdb_breaker['probing'] = False
+
+def _prune_rtdb_cache(now):
+    """Descarta entradas vencidas y las menos usadas por encima de RTDB_CACHE_MAX_ENTRIES (con el lock tomado)"""
+    for key in [k for k, (fetched_at, _) in rtdb_cache.items() if now - fetched_at > RTDB_CACHE_MAX_AGE_SECONDS]:
+        del rtdb_cache[key]
+    while len(rtdb_cache) > RTDB_CACHE_MAX_ENTRIES:
+        rtdb_cache.popitem(last=False)
+
+def remember_good_result(key, data):
+    """Guarda `data` como último resultado bueno para `key`"""
+    now = time.time()
+    with rtdb_lock:
+        rtdb_cache[key] = (now, data)
+        rtdb_cache.move_to_end(key)
+        _prune_rtdb_cache(now)
+
+def _store_rtdb_result(key, future):
+    """Guarda el resultado en cache aunque llegue después del timeout (revalidación)"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    remember_good_result(key, future.result())
+
+def serve_stale(key, reason):
+    """Devuelve el último resultado bueno de `key` y marca la respuesta como desactualizada"""
+    now = time.time()
+    with rtdb_lock:
+        _prune_rtdb_cache(now)
+        cached = rtdb_cache.get(key)
+        if cached is not None:
+            rtdb_cache.move_to_end(key)
+    if cached is None:
+        raise RTDBUnavailable(f"RTDB no disponible para '{key}' ({reason}) y no hay datos en cache")
+    fetched_at, data = cached
+    logging.warning(f"Sirviendo datos desactualizados de '{key}' ({reason}), antigüedad: {now - fetched_at:.0f}s")
+    if has_request_context():
+        g.stale_data = True
+    return data
+
+def rtdb_get(path, shallow=False, use_cache=True):
+    """
+    Lee `path` de RTDB con timeout por llamada y circuit breaker.
+    Si RTDB está lento o caído se devuelve el último resultado bueno (stale-while-revalidate).
+    Con use_cache=False no se guarda el resultado y un fallo lanza RTDBUnavailable.
+    """
+    key = f'{path}?shallow=true' if shallow else path
+    allowed, is_probe = _breaker_allows_call()
+    if not allowed:
+        return serve_stale(key, "circuit breaker abierto")
+    future = rtdb_executor.submit(db.reference(path).get, shallow=shallow)
+    if use_cache:
+        future.add_done_callback(lambda f: _store_rtdb_result(key, f))
+    try:
+        data = future.result(timeout=RTDB_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        _record_rtdb_failure(is_probe)
+        return serve_stale(key, f"timeout de {RTDB_TIMEOUT_SECONDS}s")
+    except Exception as e:
+        _record_rtdb_failure(is_probe)
+        return serve_stale(key, str(e))
+    _record_rtdb_success()
+    return data
+
+@app.context_processor
+def inject_stale_flag():
+    """Expone a las plantillas si alguna lectura se sirvió desde cache"""
+    return {'stale_data': g.get('stale_data', False), 'downsample_stride': g.get('downsample_stride', 1)}
+
+@app.after_request
+def add_stale_header(response):
+    if g.get('stale_data'):
+        response.headers['X-Data-Stale'] = 'true'
+    if g.get('downsample_stride', 1) > 1:
+        response.headers['X-Data-Downsampled'] = str(g.downsample_stride)
+    return response
+
 # Decorador para verificar autenticación
 def login_required(f):
     @wraps(f)
@@ -102,11 +256,42 @@ def analizar_depreciacion_luz(timestamps, valores_luz):
     
     return fechas_pred, luz_pred, fecha_80, max_luz
 
+def analizar_depreciacion_luz_array(timestamps, valores_luz):
+    """Igual que analizar_depreciacion_luz, sobre arrays numpy (timestamps datetime64[ms] en UTC)"""
+    encendida = valores_luz > 100
+    if not encendida.any():
+        return None, None, None, None
+
+    timestamps_filtrados = timestamps[encendida]
+    luz_filtrada = valores_luz[encendida]
+
+    t0 = timestamps_filtrados.min()
+    dias = (timestamps_filtrados - t0) / np.timedelta64(1, 'D')
+
+    max_luz = float(luz_filtrada.max())
+    luz_normalizada = luz_filtrada / max_luz * 100
+
+    modelo = LinearRegression()
+    modelo.fit(dias.reshape(-1, 1), luz_normalizada)
+
+    if modelo.coef_[0] >= 0:  # Si no hay depreciación
+        return None, None, None, None
+
+    ms_por_dia = 24 * 3600 * 1000
+    dias_hasta_80 = (80 - modelo.intercept_) / modelo.coef_[0]
+    fecha_80 = pytz.UTC.localize((t0 + np.timedelta64(int(round(dias_hasta_80 * ms_por_dia)), 'ms')).item()).astimezone(LOCAL_TZ)
+
+    dias_pred = np.linspace(0, max(dias_hasta_80 * 1.2, dias.max()), 100)
+    luz_pred = modelo.predict(dias_pred.reshape(-1, 1))
+    fechas_pred = t0 + np.rint(dias_pred * ms_por_dia).astype(np.int64).astype('timedelta64[ms]')
+
+    return fechas_pred, luz_pred, fecha_80, max_luz
+
 def get_sensors_list():
     """Obtiene la lista de sensores desde RTDB"""
     try:
-        sensors_ref = db.reference('sensores')
-        sensors_data = sensors_ref.get()
+        # Solo se usan las claves: lectura superficial, sin el historial de cada sensor
+        sensors_data = rtdb_get('sensores', shallow=True)
         if not sensors_data:
             return []
         
@@ -120,17 +305,64 @@ def get_sensors_list():
         print(f"Error al obtener lista de sensores: {e}")
         return []
 
-def get_sensor_data(sensor_id, start_date=None, end_date=None, view_all=False):
+def parse_reading_timestamp(iso_ts_key):
+    """Convierte la clave ISO 8601 de una lectura a tiempo local"""
+    # La clave ES el timestamp en formato ISO 8601 (con Z para UTC)
+    # Python < 3.11 no maneja bien la 'Z' directamente con %z
+    # Reemplazar 'Z' con '+00:00' o parsear e indicar UTC
+    if iso_ts_key.endswith('Z'):
+        iso_ts_key_adjusted = iso_ts_key[:-1] + "+00:00"
+        ts_utc = datetime.fromisoformat(iso_ts_key_adjusted)
+    else:
+        # Intentar parsear directamente si no termina en Z (puede fallar)
+        ts_utc = datetime.fromisoformat(iso_ts_key)
+        if ts_utc.tzinfo is None:
+            ts_utc = pytz.UTC.localize(ts_utc) # Asumir UTC si no hay timezone
+
+    # Convertir a tiempo local
+    return ts_utc.astimezone(LOCAL_TZ)
+
+MONTH_KEY_RE = re.compile(r'^(\d{4})[-_]?(\d{2})$')
+
+def select_month_keys(month_keys, start_date=None, end_date=None):
+    """
+    Claves de mes (p. ej. 'YYYY-MM') que pueden tener lecturas entre start_date y end_date.
+    Las claves con otro formato se conservan siempre.
+    """
+    # Margen de un día: la clave del mes puede estar en UTC o en hora local
+    floor = (start_date - timedelta(days=1)).strftime('%Y-%m') if start_date else None
+    ceil = (end_date + timedelta(days=1)).strftime('%Y-%m') if end_date else None
+    selected = []
+    for month_key in sorted(month_keys):
+        match = MONTH_KEY_RE.match(month_key)
+        if match:
+            month = f'{match.group(1)}-{match.group(2)}'
+            if (floor and month < floor) or (ceil and month > ceil):
+                continue
+        selected.append(month_key)
+    return selected
+
+def get_sensor_data(sensor_id, start_date=None, end_date=None, view_all=False, analyze=True):
     """
     Obtiene datos del sensor desde RTDB.
+    Con view_all y VIEW_ALL_BOUNDED_MEMORY se usa get_sensor_data_bounded (devuelve arrays numpy).
+    Con analyze=False no se calcula la tendencia de luz (lecturas incrementales).
     """
+    if view_all and VIEW_ALL_BOUNDED_MEMORY:
+        return get_sensor_data_bounded(sensor_id, start_date, end_date, analyze)
+
     logging.info(f"Buscando datos para sensor: {sensor_id}, Rango: {start_date} a {end_date}, Ver todo: {view_all}")
     try:
-        # Referencia al sensor específico
-        sensor_ref = db.reference(f'sensores/{sensor_id}')
-        sensor_data = sensor_ref.get()
-        
-        if not sensor_data:
+        # Leer datos del sensor (con timeout y respaldo en cache). Con fecha de inicio
+        # solo se piden los meses del rango, cada uno por separado
+        if start_date:
+            month_keys = select_month_keys(rtdb_get(f'sensores/{sensor_id}', shallow=True) or {}, start_date, end_date)
+            sensor_data = ((month_key, rtdb_get(f'sensores/{sensor_id}/{month_key}')) for month_key in month_keys)
+        else:
+            month_keys = rtdb_get(f'sensores/{sensor_id}')
+            sensor_data = (month_keys or {}).items()
+
+        if not month_keys:
             logging.warning(f"No se encontraron datos crudos para el sensor {sensor_id}")
             return [], [], [], None, None, None, None
         
@@ -144,26 +376,12 @@ def get_sensor_data(sensor_id, start_date=None, end_date=None, view_all=False):
         filtered_out_count = 0
         parse_error_count = 0
         
-        for month_key, month_data in sensor_data.items(): 
+        for month_key, month_data in sensor_data: 
             if isinstance(month_data, dict):
                 for iso_ts_key, reading_dict in month_data.items():
                     if isinstance(reading_dict, dict):
                         try:
-                            # La clave ES el timestamp en formato ISO 8601 (con Z para UTC)
-                            # Necesitamos parsearlo
-                            # Python < 3.11 no maneja bien la 'Z' directamente con %z
-                            # Reemplazar 'Z' con '+00:00' o parsear e indicar UTC
-                            if iso_ts_key.endswith('Z'):
-                                iso_ts_key_adjusted = iso_ts_key[:-1] + "+00:00"
-                                ts_utc = datetime.fromisoformat(iso_ts_key_adjusted)
-                            else:
-                                # Intentar parsear directamente si no termina en Z (puede fallar)
-                                ts_utc = datetime.fromisoformat(iso_ts_key)
-                                if ts_utc.tzinfo is None:
-                                     ts_utc = pytz.UTC.localize(ts_utc) # Asumir UTC si no hay timezone
-
-                            # Convertir a tiempo local
-                            ts = ts_utc.astimezone(LOCAL_TZ)
+                            ts = parse_reading_timestamp(iso_ts_key)
                             
                             # Filtrar por fecha si el usuario especificó rangos
                             if (effective_start_date and ts < effective_start_date) or (effective_end_date and ts > effective_end_date):
@@ -201,17 +419,171 @@ def get_sensor_data(sensor_id, start_date=None, end_date=None, view_all=False):
         
         # Análisis de depreciación de luz
         fechas_pred, luz_pred, fecha_80, max_luz = None, None, None, None
-        if len(all_readings) >= 10:  # Solo analizar si hay suficientes puntos
+        if analyze and len(all_readings) >= 10:  # Solo analizar si hay suficientes puntos
             fechas_pred, luz_pred, fecha_80, max_luz = analizar_depreciacion_luz(timestamps, luz)
             
         return timestamps, temperaturas, luz, fechas_pred, luz_pred, fecha_80, max_luz
 
+    except RTDBUnavailable:
+        # Sin datos ni respaldo: que la vista muestre el error en lugar de "No hay datos"
+        raise
     except Exception as e:
         logging.error(f"Error general al obtener datos del sensor {sensor_id}: {e}")
         import traceback
         traceback.print_exc()
         return [], [], [], None, None, None, None
 
+def _decode_sensor_months(sensor_id, months, start_date, end_date):
+    """
+    Decodifica pares (month_key, month_data) y devuelve (timestamps, temperaturas, luz, stride):
+    arrays numpy ordenados y el submuestreo aplicado (1 de cada `stride` lecturas)
+    """
+    max_readings = max(int(VIEW_ALL_MEMORY_BUDGET_MB * 1024 * 1024) // (BYTES_PER_READING + OUTPUT_BYTES_PER_POINT), 1)
+    epoch = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+    # Instante UTC en ms, temperatura y luz
+    ts_ms, temperaturas, luces = array('q'), array('d'), array('d')
+    stride = 1  # Se guarda una de cada `stride` lecturas
+    index = 0
+    processed_count = 0
+    filtered_out_count = 0
+    parse_error_count = 0
+
+    for month_key, month_data in months:
+        if not isinstance(month_data, dict):
+            continue
+        for iso_ts_key, reading_dict in month_data.items():
+            if not isinstance(reading_dict, dict):
+                continue
+            try:
+                ts = parse_reading_timestamp(iso_ts_key)
+                if (start_date and ts < start_date) or (end_date and ts > end_date):
+                    filtered_out_count += 1
+                    continue
+
+                # Convertir todo antes de guardar, para que los tres arrays sigan alineados
+                reading_ms = (ts - epoch) // timedelta(milliseconds=1)
+                temperatura = float(reading_dict.get('temperatura', 0))
+                luz = float(reading_dict.get('luz', 0))
+
+                # El submuestreo cuenta solo lecturas válidas
+                index += 1
+                if (index - 1) % stride:
+                    continue
+
+                ts_ms.append(reading_ms)
+                temperaturas.append(temperatura)
+                luces.append(luz)
+                processed_count += 1
+
+                # Presupuesto superado: quedarse con una de cada dos lecturas
+                if len(ts_ms) > max_readings:
+                    ts_ms, temperaturas, luces = ts_ms[::2], temperaturas[::2], luces[::2]
+                    stride *= 2
+            except ValueError as ve:
+                parse_error_count += 1
+                logging.warning(f"Error al parsear lectura '{iso_ts_key}' para {sensor_id}: {ve}")
+            except Exception as e:
+                logging.error(f"Error procesando lectura con clave {iso_ts_key} para {sensor_id}: {e} - Datos: {reading_dict}")
+        # Liberar el mes antes de pedir el siguiente
+        del month_data
+
+    logging.info(f"Procesados: {processed_count}, Conservados: {len(ts_ms)} (1 de cada {stride}), Filtrados: {filtered_out_count}, Errores Parseo: {parse_error_count} para {sensor_id}")
+    if not ts_ms:
+        return None
+
+    order = np.argsort(np.frombuffer(ts_ms, dtype=np.int64), kind='stable')
+    timestamps = np.frombuffer(ts_ms, dtype=np.int64)[order].view('datetime64[ms]')
+    return timestamps, np.frombuffer(temperaturas)[order], np.frombuffer(luces)[order], stride
+
+def _read_sensor_arrays(sensor_id, start_date, end_date):
+    """Lee de RTDB solo los meses del rango, uno a la vez, y los decodifica en arrays compactos"""
+    month_keys = rtdb_get(f'sensores/{sensor_id}', shallow=True)
+    if not month_keys:
+        logging.warning(f"No se encontraron datos crudos para el sensor {sensor_id}")
+        return None
+    # Los meses no se guardan en cache: solo se conserva la serie compacta
+    months = ((month_key, rtdb_get(f'sensores/{sensor_id}/{month_key}', use_cache=False))
+              for month_key in select_month_keys(month_keys, start_date, end_date))
+    return _decode_sensor_months(sensor_id, months, start_date, end_date)
+
+def _stale_sensor_arrays(sensor_id, cache_key, start_date, end_date):
+    """
+    Respaldo de get_sensor_data_bounded cuando RTDB no responde: la serie compacta guardada,
+    o los datos crudos que otras vistas dejaron en cache. Lanza RTDBUnavailable si no hay nada.
+    """
+    if cache_key:
+        try:
+            return serve_stale(cache_key, 'respaldo de ver todo')
+        except RTDBUnavailable:
+            pass
+    try:
+        sensor_data = serve_stale(f'sensores/{sensor_id}', 'respaldo de ver todo')
+        months = ((month_key, sensor_data[month_key]) for month_key in select_month_keys(sensor_data, start_date, end_date))
+    except RTDBUnavailable:
+        # Meses sueltos leídos por la vista por defecto; falla si falta alguno del rango
+        month_keys = serve_stale(f'sensores/{sensor_id}?shallow=true', 'respaldo de ver todo')
+        months = [(month_key, serve_stale(f'sensores/{sensor_id}/{month_key}', 'respaldo de ver todo'))
+                  for month_key in select_month_keys(month_keys, start_date, end_date)]
+    return _decode_sensor_months(sensor_id, months, start_date, end_date)
+
+def get_sensor_data_bounded(sensor_id, start_date=None, end_date=None, analyze=True):
+    """
+    Variante de get_sensor_data para "ver todo" con memoria acotada por petición.
+    Cada mes se libera tras decodificarlo y las lecturas se guardan en arrays compactos;
+    si la serie (incluida su salida a Plotly/JSON) superaría VIEW_ALL_MEMORY_BUDGET_MB se submuestrea
+    de forma uniforme y se marca la respuesta como reducida; la tendencia se calcula sobre esa serie.
+    Devuelve timestamps como datetime64[ms] en UTC (ver local_isoformat) y temperatura/luz como arrays float.
+    """
+    logging.info(f"Buscando datos (memoria acotada) para sensor: {sensor_id}, Rango: {start_date} a {end_date}")
+    # Solo la vista completa sin fechas se guarda como respaldo, para no acumular un resultado por rango
+    cache_key = f'view_all:{sensor_id}' if start_date is None and end_date is None else None
+    try:
+        try:
+            series = _read_sensor_arrays(sensor_id, start_date, end_date)
+            if cache_key and series is not None:
+                remember_good_result(cache_key, series)
+        except RTDBUnavailable as e:
+            logging.warning(f"Lectura de 'ver todo' fallida para {sensor_id}, buscando respaldo: {e}")
+            series = _stale_sensor_arrays(sensor_id, cache_key, start_date, end_date)
+
+        if series is None:
+            return [], [], [], None, None, None, None
+        timestamps, temperaturas, luz, stride = series
+        if stride > 1 and has_request_context():
+            g.downsample_stride = stride
+
+        # Análisis de depreciación de luz
+        fechas_pred, luz_pred, fecha_80, max_luz = None, None, None, None
+        if analyze and len(timestamps) >= 10:  # Solo analizar si hay suficientes puntos
+            fechas_pred, luz_pred, fecha_80, max_luz = analizar_depreciacion_luz_array(timestamps, luz)
+
+        return timestamps, temperaturas, luz, fechas_pred, luz_pred, fecha_80, max_luz
+
+    except RTDBUnavailable:
+        # Sin datos ni respaldo: que la vista muestre el error en lugar de "No hay datos"
+        raise
+    except Exception as e:
+        logging.error(f"Error general al obtener datos del sensor {sensor_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        return [], [], [], None, None, None, None
+
+def local_isoformat(timestamps):
+    """
+    Instantes datetime64[ms] (UTC) a cadenas ISO 8601 en hora local con offset, como datetime.isoformat().
+    Se conservan los milisegundos si alguna lectura los tiene (sirven de cursor para ?since=).
+    """
+    unit = 'ms' if (timestamps.astype('datetime64[ms]').view(np.int64) % 1000).any() else 's'
+    strings = np.datetime_as_string(timestamps, unit=unit, timezone=LOCAL_TZ)
+    if len(strings) == 0:
+        return strings
+    # numpy escribe el offset como '-0500'; isoformat() usa '-05:00'
+    strings = strings.astype(f'U{np.char.str_len(strings).max()}')
+    chars = strings.view('U1').reshape(len(strings), -1)
+    chars = np.concatenate([chars[:, :-2], np.full((len(strings), 1), ':'), chars[:, -2:]], axis=1)
+    return np.ascontiguousarray(chars).view(f'U{chars.shape[1]}').ravel()
+
 def get_display_name(sensor_id):
     """Devuelve un nombre corto para mostrar al usuario"""
     prefix = 'ESP_RACK_FLOWER_'
@@ -219,6 +591,64 @@ def get_display_name(sensor_id):
         return sensor_id[len(prefix):]
     return sensor_id
 
+def parse_date_range(args):
+    """Obtiene (start_date, end_date, view_all) de los parámetros; sin fechas se usa el último mes"""
+    start_date_str = args.get('start_date', '')
+    end_date_str = args.get('end_date', '')
+    view_all = args.get('view_all', 'false').lower() == 'true'
+
+    start_date, end_date = None, None
+    if start_date_str:
+        sd = datetime.strptime(start_date_str, '%Y-%m-%d')
+        start_date = LOCAL_TZ.localize(sd)
+    if end_date_str:
+        ed = datetime.strptime(end_date_str, '%Y-%m-%d')
+        end_date = LOCAL_TZ.localize(ed)
+        # Ajustar al final del día
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+
+    # Si no se proporciona fecha, usar último mes
+    if not start_date and not end_date and not view_all:
+        end_date = datetime.now(LOCAL_TZ)
+        start_date = end_date - relativedelta(months=1)
+
+    return start_date, end_date, view_all
+
+@lru_cache(maxsize=1)
+def get_plot_templates():
+    """
+    Layouts y estilos de trazas de las gráficas de detalle, serializados una sola vez.
+    El cliente solo rellena x/y con los datos de /api/sensor/<sensor_id>.
+    """
+    common_layout = dict(
+        xaxis_title='Fecha',
+        hovermode='x unified',
+        height=400,
+        template='plotly_white',
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    templates = {
+        'temp': {
+            'layout': go.Layout(title='Temperatura vs. Tiempo', yaxis_title='Temperatura (°C)', **common_layout),
+            'traces': [
+                dict(type='scatter', mode='lines+markers', name='Temperatura',
+                     line=dict(color='#3b82f6', width=2), marker=dict(size=4))
+            ]
+        },
+        'luz': {
+            'layout': go.Layout(title='Nivel de Luz vs. Tiempo', yaxis_title='Nivel de Luz (fc)', **common_layout),
+            'traces': [
+                dict(type='scatter', mode='lines+markers', name='Nivel de Luz (fc)',
+                     line=dict(color='#f59e0b', width=2), marker=dict(size=4)),
+                dict(type='scatter', mode='lines', name='Tendencia FC',
+                     line=dict(color='#ef4444', width=2, dash='dash')),
+                dict(type='scatter', mode='lines', name=f'Umbral {THRESHOLD_FOOT_CANDLES} fc',
+                     line=dict(color='#10b981', width=1.5, dash='dot'))
+            ]
+        }
+    }
+    return json.dumps(templates, cls=PlotlyJSONEncoder)
+
 def get_led_state():
     """Obtiene el estado actual del LED desde cache o RTDB"""
     global cached_led_state
@@ -335,31 +765,31 @@ def sensor_detail(sensor_id):
         # Obtener parámetros
         start_date_str = request.args.get('start_date', '')
         end_date_str = request.args.get('end_date', '')
-        view_all = request.args.get('view_all', 'false').lower() == 'true'
-
-        # Parsear fechas
-        start_date, end_date = None, None
-        if start_date_str:
-            sd = datetime.strptime(start_date_str, '%Y-%m-%d')
-            start_date = LOCAL_TZ.localize(sd)
-        if end_date_str:
-            ed = datetime.strptime(end_date_str, '%Y-%m-%d')
-            end_date = LOCAL_TZ.localize(ed)
-            # Ajustar al final del día
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-            
-        # Si no se proporciona fecha, usar último mes
-        if not start_date and not end_date and not view_all:
-            end_date = datetime.now(LOCAL_TZ)
-            start_date = end_date - relativedelta(months=1)
-            
+        start_date, end_date, view_all = parse_date_range(request.args)
+
+        # En modo cliente la página solo lleva la plantilla; los datos se piden a la API
+        if PLOT_RENDER_MODE == 'client':
+            return render_template(
+                'sensor_detail.html',
+                client_mode=True,
+                sensor_id=sensor_id,
+                display_name=display_name,
+                plot_templates=get_plot_templates(),
+                start_date=start_date_str,
+                end_date=end_date_str,
+                current_date=datetime.now(LOCAL_TZ).strftime('%d/%m/%Y %H:%M:%S'),
+                led_state=get_led_state(),
+                user=session.get('user'),
+                threshold_fc=THRESHOLD_FOOT_CANDLES
+            )
+
         # Obtener datos del sensor
         timestamps, temperaturas, luz, fechas_pred, luz_pred, fecha_80, max_luz = get_sensor_data(
             sensor_id, start_date, end_date, view_all
         )
         
         # Si no hay datos, mostrar mensaje
-        if not timestamps:
+        if len(timestamps) == 0:
             return render_template(
                 'sensor_detail.html', 
                 error=f"No hay datos disponibles para el sensor {display_name} en el período seleccionado.",
@@ -372,6 +802,12 @@ def sensor_detail(sensor_id):
                 user=session.get('user')
             )
             
+        # Los arrays de "ver todo" van en UTC: pasarlos a hora local como en las listas de datetime
+        if isinstance(timestamps, np.ndarray):
+            timestamps = local_isoformat(timestamps)
+        if isinstance(fechas_pred, np.ndarray):
+            fechas_pred = local_isoformat(fechas_pred)
+
         # Crear gráficas con Plotly
         # Gráfica de temperatura
         fig_temp = go.Figure()
@@ -394,13 +830,11 @@ def sensor_detail(sensor_id):
         )
         
         # Gráfica de luz en foot-candles
-        # Inicializar parámetros de conversión
-        DEFAULT_FOOT_CANDLES = float(os.environ.get('DEFAULT_FOOT_CANDLES', 12))
-        threshold_fc = float(os.environ.get('THRESHOLD_FOOT_CANDLES', 7))
+        threshold_fc = THRESHOLD_FOOT_CANDLES
         # Calcular valores en fc basados en max_luz
-        fc_values = [l / max_luz * DEFAULT_FOOT_CANDLES for l in luz] if (luz and max_luz) else []
+        fc_values = np.asarray(luz) / max_luz * DEFAULT_FOOT_CANDLES if (len(luz) and max_luz) else []
         # Calcular tendencia en fc
-        fc_pred = [p / 100 * DEFAULT_FOOT_CANDLES for p in luz_pred] if (luz_pred is not None and max_luz) else []
+        fc_pred = luz_pred / 100 * DEFAULT_FOOT_CANDLES if (luz_pred is not None and max_luz) else []
         
         fig_luz = go.Figure()
         # Trazar nivel de luz en fc
@@ -414,7 +848,7 @@ def sensor_detail(sensor_id):
         ))
         
         # Si hay datos de predicción, agregarlos
-        if fechas_pred is not None and fc_pred:
+        if fechas_pred is not None and len(fc_pred):
             fig_luz.add_trace(go.Scatter(
                 x=fechas_pred,
                 y=fc_pred,
@@ -424,7 +858,7 @@ def sensor_detail(sensor_id):
             ))
             # Umbral fijo en fc
             fig_luz.add_trace(go.Scatter(
-                x=[min(timestamps), max(fechas_pred)],
+                x=[timestamps[0], fechas_pred[-1]],
                 y=[threshold_fc, threshold_fc],
                 mode='lines',
                 name=f'Umbral {threshold_fc} fc',
@@ -446,8 +880,8 @@ def sensor_detail(sensor_id):
         plot_luz = json.dumps(fig_luz, cls=PlotlyJSONEncoder)
         
         # Obtener último valor para mostrar en tiempo real
-        current_temp = temperaturas[-1] if temperaturas else None
-        current_fc = fc_values[-1] if fc_values else None
+        current_temp = temperaturas[-1] if len(temperaturas) else None
+        current_fc = fc_values[-1] if len(fc_values) else None
         
         # Obtener fecha actual para la plantilla
         current_date = datetime.now(LOCAL_TZ).strftime('%d/%m/%Y %H:%M:%S')
@@ -616,33 +1050,59 @@ def api_sensors():
         return jsonify({"error": "No autenticado"}), 401
     return jsonify(get_sensors_list())
 
+def isoformat_all(timestamps):
+    """Convierte una lista de datetime o un array datetime64 (UTC) a cadenas ISO 8601 en hora local"""
+    if isinstance(timestamps, np.ndarray):
+        return local_isoformat(timestamps).tolist()
+    return [ts.isoformat() for ts in timestamps]
+
+def values_to_list(values):
+    """Convierte un array numpy a lista para serializar a JSON"""
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
 @app.route('/api/sensor/<sensor_id>')
 def api_sensor_data(sensor_id):
     """API para obtener datos de un sensor específico"""
     if 'user' not in session:
         return jsonify({"error": "No autenticado"}), 401
     try:
-        start_date_str = request.args.get('start_date', '')
-        end_date_str = request.args.get('end_date', '')
-        view_all = request.args.get('view_all', 'false').lower() == 'true'
-        
-        # Parsear fechas
-        start_date, end_date = None, None
-        if start_date_str:
-            sd = datetime.strptime(start_date_str, '%Y-%m-%d')
-            start_date = LOCAL_TZ.localize(sd)
-        if end_date_str:
-            ed = datetime.strptime(end_date_str, '%Y-%m-%d')
-            end_date = LOCAL_TZ.localize(ed)
-        
+        start_date, end_date, view_all = parse_date_range(request.args)
+
+        # 'since' (ISO 8601): solo lecturas posteriores, para añadir puntos de forma incremental
+        since_str = request.args.get('since', '')
+        since = datetime.fromisoformat(since_str) if since_str else None
+        if since is not None:
+            if since.tzinfo is None:
+                since = LOCAL_TZ.localize(since)
+            start_date = max(start_date, since) if start_date else since
+
+        # Las lecturas incrementales solo leen los meses desde 'since' y no recalculan la tendencia
         timestamps, temperaturas, luz, fechas_pred, luz_pred, fecha_80, max_luz = get_sensor_data(
-            sensor_id, start_date, end_date, view_all
+            sensor_id, start_date, end_date, view_all, analyze=since is None
         )
-        
+
+        if since is not None:
+            if isinstance(timestamps, np.ndarray):
+                since_utc = np.datetime64(since.astimezone(pytz.UTC).replace(tzinfo=None), 'ms')
+                first_new = int(np.searchsorted(timestamps, since_utc, side='right'))
+            else:
+                first_new = next((i for i, ts in enumerate(timestamps) if ts > since), len(timestamps))
+            timestamps, temperaturas, luz = timestamps[first_new:], temperaturas[first_new:], luz[first_new:]
+            fechas_pred, luz_pred, fecha_80, max_luz = None, None, None, None
+
         return jsonify({
-            'timestamps': [ts.isoformat() for ts in timestamps],
-            'temperaturas': temperaturas,
-            'luz': luz
+            'timestamps': isoformat_all(timestamps),
+            'temperaturas': values_to_list(temperaturas),
+            'luz': values_to_list(luz),
+            'max_luz': max_luz,
+            'fechas_pred': isoformat_all(fechas_pred) if fechas_pred is not None else None,
+            'luz_pred': luz_pred.tolist() if luz_pred is not None else None,
+            'fecha_80': fecha_80.isoformat() if fecha_80 else None,
+            'default_fc': DEFAULT_FOOT_CANDLES,
+            'threshold_fc': THRESHOLD_FOOT_CANDLES,
+            'stale': g.get('stale_data', False),
+            'downsampled': g.get('downsample_stride', 1) > 1,
+            'downsample_stride': g.get('downsample_stride', 1)
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500